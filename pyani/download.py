@@ -496,9 +496,17 @@ def create_hash(fname: Path) -> str:
 
     We can ignore the Bandit B303 error as we're not using the hash for
     cryptographic purposes.
+
+    MD5 is retained (rather than e.g. SHA-256) because the hash must match
+    NCBI's md5checksums.txt files, and identifies genomes in existing label,
+    class and database files. Where available (Python 3.11+),
+    hashlib.file_digest() is used, which reads the file into a single reused
+    buffer.
     """
-    hash_md5 = hashlib.md5()  # nosec
     with open(fname, "rb") as fhandle:
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(fhandle, "md5").hexdigest()  # nosec
+        hash_md5 = hashlib.md5()  # nosec
         for chunk in iter(lambda: fhandle.read(65536), b""):
             hash_md5.update(chunk)
     return hash_md5.hexdigest()
@@ -42,17 +42,23 @@
 This SQLAlchemy-based ORM replaces the previous SQL-based module
 """
 
+import atexit
+import logging
+import sqlite3
+
+from itertools import islice
 from pathlib import Path
-from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from typing import Any, Dict, Iterator, List, NamedTuple, Tuple
 
 import numpy as np  # type: ignore
 import pandas as pd  # type: ignore
 
-from sqlalchemy import and_  # type: ignore
+from sqlalchemy import and_, event, func, or_, select  # type: ignore
 from sqlalchemy import UniqueConstraint, create_engine, Table
 from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, Float, Boolean
 from sqlalchemy.ext.declarative import declarative_base  # type: ignore
 from sqlalchemy.orm import relationship, sessionmaker  # type: ignore
+from sqlalchemy.pool import QueuePool  # type: ignore
 
 from pyani import PyaniException
 from pyani.pyani_files import (
@@ -75,20 +81,40 @@ class PyaniORMException(PyaniException):
 Base = declarative_base()  # type: Any
 Session = sessionmaker()  # pylint: disable=C0103
 
+# NumPy structured array layout for bulk comparison results, as returned by
+# get_comparisons_array()
+COMPARISON_DTYPE = np.dtype(
+    [
+        ("query_id", "<i8"),
+        ("subject_id", "<i8"),
+        ("aln_length", "<f8"),
+        ("sim_errs", "<f8"),
+        ("identity", "<f8"),
+        ("cov_query", "<f8"),
+        ("cov_subject", "<f8"),
+    ]
+)
+
 # Linker table between genomes and runs tables
+# Each genome is associated with a run at most once. The unique constraint
+# leads with run_id, so its index also serves lookups of the genomes for a run
 rungenome = Table(  # pylint: disable=C0103
     "runs_genomes",
     Base.metadata,
     Column("genome_id", Integer, ForeignKey("genomes.genome_id")),
     Column("run_id", Integer, ForeignKey("runs.run_id")),
+    UniqueConstraint("run_id", "genome_id"),
 )
 
 # Linker table between comparisons and runs tables
+# Each comparison is associated with a run at most once. The unique constraint
+# leads with run_id, so its index also serves lookups of the comparisons for a run
 runcomparison = Table(  # pylint: disable=C0103
     "runs_comparisons",
     Base.metadata,
     Column("comparison_id", Integer, ForeignKey("comparisons.comparison_id")),
     Column("run_id", Integer, ForeignKey("runs.run_id")),
+    UniqueConstraint("run_id", "comparison_id"),
 )
 
 
@@ -263,7 +289,16 @@ class Run(Base):
 
 class Comparison(Base):
 
-    """Describes a single pairwise comparison between two genomes."""
+    """Describes a single pairwise comparison between two genomes.
+
+    fragsize and maxmatch are not nullable, and default to zero/False when they
+    do not apply to the comparison program, so that lookups on these columns
+    compare values with ``=`` (SQL NULL never compares equal to NULL).
+
+    The unique constraint on (query_id, subject_id, program, version, fragsize,
+    maxmatch) is backed by an SQLite index, which also serves lookups of
+    existing comparisons on those columns.
+    """
 
     __tablename__ = "comparisons"
     __table_args__ = (
@@ -282,8 +317,8 @@ class Comparison(Base):
     cov_subject = Column(Float)
     program = Column(String)
     version = Column(String)
-    fragsize = Column(Integer)
-    maxmatch = Column(Boolean)
+    fragsize = Column(Integer, nullable=False, default=0, server_default="0")
+    maxmatch = Column(Boolean, nullable=False, default=False, server_default="0")
 
     query = relationship(
         "Genome", foreign_keys=[query_id], back_populates="query_comparisons"
@@ -312,37 +347,217 @@ class Comparison(Base):
         return "<Comparison(comparison_id={})>".format(self.comparison_id)
 
 
+# Engines are cached by database path, so that repeated calls to get_session()
+# or create_db() for the same database reuse the engine's connection pool,
+# rather than opening a new SQLite3 connection each time. SQLAlchemy uses a
+# NullPool for file-based SQLite databases by default, so we request a
+# QueuePool. Each session checks out its own pooled connection (and so has its
+# own transaction), which is returned to the pool, still open, when it ends.
+_ENGINES = {}  # type: Dict[str, Any]
+
+# PRAGMAs applied to every new SQLite3 connection. synchronous=NORMAL avoids
+# an fsync on every commit in WAL mode (see create_db()). The negative
+# cache_size is in KiB (~64MB).
+# mmap_size lets SQLite read database pages through memory-mapped I/O rather
+# than copying them with read(); SQLite caps it at its compiled-in maximum.
+# analysis_limit bounds the rows sampled per index by ANALYZE/PRAGMA optimize.
+SQLITE_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA mmap_size=30000000000",
+    "PRAGMA analysis_limit=1000",
+)
+
+
+# Number of prepared statements each SQLite3 connection keeps for reuse. The
+# sqlite3 module default (100 or 128) can be exceeded by the distinct ORM
+# statements issued during a run, forcing statements to be re-prepared.
+SQLITE_CACHED_STATEMENTS = 256
+
+# Schema version of databases created by this version of pyani, stored as the
+# database's PRAGMA user_version. Databases created by earlier versions have
+# user_version 0, and are updated by upgrade_db().
+SCHEMA_VERSION = 2
+
+# Indexes on run_id for the linker tables of databases created by earlier
+# versions of pyani. Newer databases use the unique constraints on these tables.
+RUN_LINKER_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS ix_runs_genomes_run_id ON runs_genomes (run_id)",
+    "CREATE INDEX IF NOT EXISTS ix_runs_comparisons_run_id "
+    "ON runs_comparisons (run_id)",
+)
+
+# Maximum number of values bound in a single IN (...) clause. SQLite before
+# 3.32 allows at most 999 host parameters in a statement.
+SQLITE_MAX_IN_VALUES = 500
+
+
+def set_sqlite_pragmas(dbapi_conn: Any, conn_record: Any) -> None:
+    """Apply SQLITE_PRAGMAS to a newly-opened SQLite3 connection.
+
+    :param dbapi_conn:  DBAPI (sqlite3) connection
+    :param conn_record:  SQLAlchemy connection pool record (unused)
+    """
+    for pragma in SQLITE_PRAGMAS:
+        dbapi_conn.execute(pragma)
+
+
+def optimize_sqlite_connection(dbapi_conn: Any, conn_record: Any) -> None:
+    """Run PRAGMA optimize on an SQLite3 connection before it is closed.
+
+    :param dbapi_conn:  DBAPI (sqlite3) connection
+    :param conn_record:  SQLAlchemy connection pool record (unused)
+
+    This updates the query planner statistics for any table whose contents
+    have changed substantially while the connection was open. Connections
+    that made no changes to the database (e.g. for pyani report or plot) are
+    closed without running it.
+
+    SQLAlchemy does not handle exceptions raised by this listener, which would
+    leave the connection open, so failures (e.g. if another process holds a
+    lock on the database) are logged and ignored.
+    """
+    logger = logging.getLogger(__name__)
+    try:
+        if dbapi_conn.total_changes:
+            dbapi_conn.execute("PRAGMA optimize")
+    except sqlite3.Error:
+        logger.debug("Could not optimize database connection", exc_info=True)
+
+
+def get_engine(dbpath: Path) -> Any:
+    """Return a (cached) SQLAlchemy engine for the pyani database at dbpath.
+
+    :param dbpath:  path to pyani database
+    """
+    key = str(Path(dbpath).resolve())
+    if key not in _ENGINES:
+        _ENGINES[key] = create_engine(
+            "sqlite:///{}".format(key),
+            echo=False,
+            poolclass=QueuePool,
+            connect_args={
+                "check_same_thread": False,
+                "cached_statements": SQLITE_CACHED_STATEMENTS,
+            },
+        )
+        event.listen(_ENGINES[key], "connect", set_sqlite_pragmas)
+        event.listen(_ENGINES[key], "close", optimize_sqlite_connection)
+    return _ENGINES[key]
+
+
+def dispose_engines() -> None:
+    """Close pooled connections for all cached database engines."""
+    while _ENGINES:
+        _, engine = _ENGINES.popitem()
+        engine.dispose()
+
+
+atexit.register(dispose_engines)
+
+
+def maintain_db(dbpath: Path) -> None:
+    """Refresh query planner statistics and checkpoint the WAL for a database.
+
+    :param dbpath:  path to pyani database
+
+    Runs ANALYZE, then copies the write-ahead log into the main database
+    file and truncates it. This should be called once an analysis run's
+    results have been committed, as it needs to write to the database.
+    """
+    with get_engine(dbpath).connect() as conn:
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
 def create_db(dbpath: Path) -> None:
     """Create an empty pyani SQLite3 database at the passed path.
 
     :param dbpath:  path to pyani database
     """
-    engine = create_engine("sqlite:///{}".format(dbpath), echo=False)
+    # Any cached engine may hold connections to a database file that has
+    # since been deleted and recreated, so we start afresh
+    engine = _ENGINES.pop(str(Path(dbpath).resolve()), None)
+    if engine is not None:
+        engine.dispose()
+    engine = get_engine(dbpath)
     Base.metadata.create_all(engine)
 
+    # WAL journalling lets readers and a writer proceed concurrently. The
+    # journal mode is stored in the database file, so we set it only when
+    # creating a new database, rather than converting existing databases
+    # (which may be on network filesystems that do not support WAL)
+    with engine.connect() as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA user_version={}".format(SCHEMA_VERSION))
+
 
 def get_session(dbpath: Path) -> Any:
     """Connect to an existing pyani SQLite3 database and return a session.
 
     :param dbpath: path to pyani database
     """
-    engine = create_engine("sqlite:///{}".format(dbpath), echo=False)
-    Session.configure(bind=engine)
+    Session.configure(bind=get_engine(dbpath))
     return Session()
 
 
-def get_comparison_dict(session: Any) -> Dict[Tuple, Any]:
-    """Return a dictionary of comparisons in the session database.
+def backfill_comparisons(session) -> int:
+    """Replace NULL fragsize/maxmatch values in the comparisons table.
 
     :param session:      live SQLAlchemy session of pyani database
 
-    Returns Comparison objects, keyed by (_.query_id, _.subject_id,
-    _.program, _.version, _.fragsize, _.maxmatch) tuple
+    Comparisons stored by earlier versions of pyani may have NULL fragsize or
+    maxmatch values. These are set to 0/False, so that the comparisons are
+    matched (and reused) by later runs. A row that would then duplicate an
+    existing comparison is left unchanged. The changes are not committed.
+
+    Returns the number of comparisons updated.
     """
-    return {
-        (_.query_id, _.subject_id, _.program, _.version, _.fragsize, _.maxmatch): _
-        for _ in session.query(Comparison).all()
-    }
+    result = session.execute(
+        Comparison.__table__.update()
+        .prefix_with("OR IGNORE")
+        .where(or_(Comparison.fragsize.is_(None), Comparison.maxmatch.is_(None)))
+        .values(
+            fragsize=func.coalesce(Comparison.fragsize, 0),
+            maxmatch=func.coalesce(Comparison.maxmatch, False),
+        )
+    )
+    return result.rowcount
+
+
+def upgrade_db(session) -> int:
+    """Update a database written by an earlier version of pyani.
+
+    :param session:      live SQLAlchemy session of pyani database
+
+    The schema version is read from PRAGMA user_version, and the database is
+    updated (and its schema version set to SCHEMA_VERSION) only if it is older
+    than the current schema, so this is cheap to call each time a database is
+    opened for an analysis. The updates are:
+
+    - version 1: NULL comparison fragsize/maxmatch values are replaced
+    - version 2: run_id is indexed in the runs_genomes and runs_comparisons
+      linker tables
+
+    Returns the number of comparisons updated.
+    """
+    try:
+        version = session.execute("PRAGMA user_version").scalar()
+        if version >= SCHEMA_VERSION:
+            return 0
+        backfilled = 0
+        if version < 1:
+            backfilled = backfill_comparisons(session)
+        if version < 2:
+            for statement in RUN_LINKER_INDEXES:
+                session.execute(statement)
+        session.execute("PRAGMA user_version={}".format(SCHEMA_VERSION))
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise PyaniORMException("Could not update database to current schema")
+    return backfilled
 
 
 def get_matrix_labels_for_run(session: Any, run_id: int) -> Dict:
@@ -364,7 +579,6 @@ def get_matrix_labels_for_run(session: Any, run_id: int) -> Dict:
             Label, and_(Genome.genome_id == Label.genome_id, Run.run_id == Label.run_id)
         )
         .filter(Run.run_id == run_id)
-        .all()
     )
     return {str(_.genome_id): _.label for _ in results}
 
@@ -388,7 +602,6 @@ def get_matrix_classes_for_run(session: Any, run_id: int) -> Dict[str, List]:
             Label, and_(Genome.genome_id == Label.genome_id, Run.run_id == Label.run_id)
         )
         .filter(Run.run_id == run_id)
-        .all()
     )
     return {str(_.genome_id): _.class_label for _ in results}
 
@@ -397,10 +610,10 @@ def filter_existing_comparisons(
     session,
     run,
     comparisons,
-    program,
-    version,
-    fragsize: Optional[int] = None,
-    maxmatch: Optional[bool] = None,
+    program: str,
+    version: str,
+    fragsize: int = 0,
+    maxmatch: bool = False,
 ) -> List:
     """Filter list of (Genome, Genome) comparisons for those not in the session db.
 
@@ -409,34 +622,69 @@ def filter_existing_comparisons(
     :param comparisons:   list of (Genome, Genome) query vs subject comparisons
     :param program:       program used for comparison
     :param version:       version of program for comparison
-    :param fragsize:      fragment size for BLAST databases
-    :param maxmatch:      maxmatch used with nucmer comparison
+    :param fragsize:      fragment size for BLAST databases (0 if not used)
+    :param maxmatch:      maxmatch used with nucmer comparison (False if not used)
 
     When passed a list of (Genome, Genome) comparisons as comparisons, check whether
     the comparison exists in the database and, if so, associate it with the passed run.
     If not, then add the (Genome, Genome) pair to a list for returning as the
     comparisons that still need to be run.
+
+    Existing comparisons are found with a single query, restricted to comparisons
+    between genomes in the passed run, and associated with the run in a single
+    transaction.
     """
-    existing_comparisons = get_comparison_dict(session)
+    # Get IDs of existing comparisons between genomes in this run, keyed by
+    # (query_id, subject_id)
+    query_rungenome = rungenome.alias()
+    subject_rungenome = rungenome.alias()
+    statement = (
+        select([Comparison.comparison_id, Comparison.query_id, Comparison.subject_id])
+        .select_from(
+            Comparison.__table__.join(
+                query_rungenome,
+                and_(
+                    query_rungenome.c.genome_id == Comparison.query_id,
+                    query_rungenome.c.run_id == run.run_id,
+                ),
+            ).join(
+                subject_rungenome,
+                and_(
+                    subject_rungenome.c.genome_id == Comparison.subject_id,
+                    subject_rungenome.c.run_id == run.run_id,
+                ),
+            )
+        )
+        .where(
+            and_(
+                Comparison.program == program,
+                Comparison.version == version,
+                Comparison.fragsize == fragsize,
+                Comparison.maxmatch == maxmatch,
+            )
+        )
+    )
+    existing_comparisons = {
+        (_.query_id, _.subject_id): _.comparison_id for _ in session.execute(statement)
+    }
+
     comparisons_to_run = []
+    comparison_ids = []
     for (qgenome, sgenome) in comparisons:
         try:
-            # Associate run with existing comparisons
-            run.comparisons.append(
-                existing_comparisons[
-                    (
-                        qgenome.genome_id,
-                        sgenome.genome_id,
-                        program,
-                        version,
-                        fragsize,
-                        maxmatch,
-                    )
-                ]
+            comparison_ids.append(
+                existing_comparisons[(qgenome.genome_id, sgenome.genome_id)]
             )
-            session.commit()
         except KeyError:
             comparisons_to_run.append((qgenome, sgenome))
+
+    # Associate run with existing comparisons
+    if comparison_ids:
+        session.execute(
+            runcomparison.insert().prefix_with("OR IGNORE"),
+            [{"comparison_id": _, "run_id": run.run_id} for _ in comparison_ids],
+        )
+        session.commit()
     return comparisons_to_run
 
 
@@ -466,6 +714,70 @@ def add_run(session, method, cmdline, date, status, name):
     return run
 
 
+def _batched(values: List, size: int) -> Iterator[List]:
+    """Yield successive lists of at most size items from values.
+
+    :param values:  list of values to split
+    :param size:    maximum number of values in each batch
+    """
+    for idx in range(0, len(values), size):
+        yield values[idx : idx + size]
+
+
+def _get_or_insert_genomes(
+    session, genome_data: List[Tuple[str, str, Path]]
+) -> Dict[str, Genome]:
+    """Return Genome objects for the passed genomes, keyed by genome hash.
+
+    :param session:       live SQLAlchemy session of pyani database
+    :param genome_data:   list of (hash, description, path) tuples for genomes
+
+    Genomes not already in the database are added to it (uncommitted).
+    """
+    # Identify which of these genomes are already in the database, and insert
+    # the remainder in a single statement. INSERT OR IGNORE skips any genome
+    # added in the meantime (e.g. by another pyani process), rather than failing
+    # on the unique genome_hash constraint. Lookups are made in batches, to stay
+    # within SQLite's limit on bound variables
+    hashes = [inhash for inhash, _, _ in genome_data]
+    try:
+        existing_hashes = {
+            _.genome_hash
+            for batch in _batched(hashes, SQLITE_MAX_IN_VALUES)
+            for _ in session.query(Genome.genome_hash).filter(
+                Genome.genome_hash.in_(batch)
+            )
+        }
+    except Exception:
+        raise PyaniORMException("Could not query database for existing genomes")
+    new_genomes = {
+        inhash: {
+            "genome_hash": inhash,
+            "path": str(abspath),
+            "length": get_genome_length(abspath),
+            "description": indesc,
+        }
+        for inhash, indesc, abspath in genome_data
+        if inhash not in existing_hashes
+    }
+    if new_genomes:
+        try:
+            session.execute(
+                Genome.__table__.insert().prefix_with("OR IGNORE"),
+                list(new_genomes.values()),
+            )
+        except Exception:
+            raise PyaniORMException("Could not add new genomes to database")
+    try:
+        return {
+            _.genome_hash: _
+            for batch in _batched(hashes, SQLITE_MAX_IN_VALUES)
+            for _ in session.query(Genome).filter(Genome.genome_hash.in_(batch))
+        }
+    except Exception:
+        raise PyaniORMException("Could not retrieve genomes from database")
+
+
 def add_run_genomes(
     session, run, indir: Path, classpath: Path, labelpath: Path
 ) -> List:
@@ -482,7 +794,7 @@ def add_run_genomes(
     on class and label strings for each genome.
 
     If the genome already exists in the database, then a Genome object is recovered
-    from the database. Otherwise, a new Genome object is created. All Genome objects
+    from the database. Otherwise, a new genome row is inserted. All Genome objects
     will be associated with the passed Run object.
 
     The session changes are committed once all genomes and labels are added to the
@@ -506,39 +818,24 @@ def add_run_genomes(
     for key in new_keys:
         label_dict[key] = LabelTuple(label_data[key] or "", class_data[key] or "")
 
-    # Get hash and sequence description for each FASTA/hash pair, and add
-    # to current session database
-    genome_ids = []
+    # Get hash and sequence description for each FASTA/hash pair
+    genome_data = []  # type: List[Tuple[str, str, Path]]
     for fastafile, hashfile in infiles:
         try:
             inhash, _ = read_hash_string(hashfile)
             indesc = read_fasta_description(fastafile)
         except Exception:
             raise PyaniORMException("Could not read genome files for database import")
-        abspath = fastafile.resolve()
-        genome_len = get_genome_length(abspath)
+        genome_data.append((inhash, indesc, fastafile.resolve()))
 
-        # If the genome is not already in the database, add it as a Genome object
-        genome = session.query(Genome).filter(Genome.genome_hash == inhash).first()
-        if not isinstance(genome, Genome):
-            try:
-                genome = Genome(
-                    genome_hash=inhash,
-                    path=str(abspath),
-                    length=genome_len,
-                    description=indesc,
-                )
-                session.add(genome)
-            except Exception:
-                raise PyaniORMException(f"Could not add genome {genome} to database")
+    # Get Genome objects for these genomes, adding any new genomes to the database
+    genomes_by_hash = _get_or_insert_genomes(session, genome_data)
 
-        # Associate this genome with the current run
-        try:
-            genome.runs.append(run)
-        except Exception:
-            raise PyaniORMException(
-                f"Could not associate genome {genome} with run {run}"
-            )
+    # Add each genome to the current run
+    # (input files with the same hash are the same genome, and are added once)
+    genomes = []
+    for inhash in dict.fromkeys(inhash for inhash, _, _ in genome_data):
+        genome = genomes_by_hash[inhash]
 
         # If there's an associated class or label for the genome, add it
         if inhash in label_dict:
@@ -555,7 +852,22 @@ def add_run_genomes(
                 raise PyaniORMException(
                     f"Could not add labels for {genome} to database."
                 )
-        genome_ids.append(genome.genome_id)
+        genomes.append(genome)
+
+    # Read the genome IDs before commit() expires the Genome objects (which
+    # would cost a SELECT per genome to reload them)
+    genome_ids = [_.genome_id for _ in genomes]
+
+    # Associate these genomes with the current run. INSERT OR IGNORE skips any
+    # genome that is already associated with the run
+    try:
+        if genome_ids:
+            session.execute(
+                rungenome.insert().prefix_with("OR IGNORE"),
+                [{"genome_id": _, "run_id": run.run_id} for _ in genome_ids],
+            )
+    except Exception:
+        raise PyaniORMException(f"Could not associate genomes with run {run}")
 
     try:
         session.commit()
@@ -565,42 +877,140 @@ def add_run_genomes(
     return genome_ids
 
 
+def add_comparisons(session, run, comparisons: List[Dict[str, Any]]) -> List[int]:
+    """Add a batch of pairwise comparison results for a run to the database.
+
+    :param session:       live SQLAlchemy session of pyani database
+    :param run:           Run object describing the parent pyani run
+    :param comparisons:   list of dicts, keyed by Comparison column name
+
+    The comparisons are inserted with a single multi-row (executemany) INSERT,
+    and associated with the passed run in the same way, rather than by
+    creating and flushing one Comparison object at a time. The changes are
+    committed as a single transaction.
+
+    Returns the list of new Comparison.comparison_id values.
+    """
+    if not comparisons:
+        return []
+
+    # Comparisons are unique on these columns, so we use them to recover the
+    # IDs assigned to the new rows
+    keycols = ("query_id", "subject_id", "program", "version", "fragsize", "maxmatch")
+    newkeys = {tuple(_[col] for col in keycols) for _ in comparisons}
+    try:
+        max_id = session.query(func.max(Comparison.comparison_id)).scalar() or 0
+        session.execute(Comparison.__table__.insert(), comparisons)
+        comparison_ids = [
+            _.comparison_id
+            for _ in session.query(
+                Comparison.comparison_id, *[getattr(Comparison, col) for col in keycols]
+            ).filter(Comparison.comparison_id > max_id)
+            if tuple(_[1:]) in newkeys
+        ]
+        session.execute(
+            runcomparison.insert().prefix_with("OR IGNORE"),
+            [{"comparison_id": _, "run_id": run.run_id} for _ in comparison_ids],
+        )
+        # Refresh planner statistics for the comparisons table after bulk loading
+        session.execute("ANALYZE comparisons")
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise PyaniORMException(f"Could not add comparisons for run {run} to database")
+    return comparison_ids
+
+
+def get_comparisons_array(session, run_id: int) -> np.ndarray:
+    """Return results of all comparisons for a run as a NumPy structured array.
+
+    :param session:  live SQLAlchemy session of pyani database
+    :param run_id:   the Run.run_id value for the comparisons
+
+    The array fields are named for the corresponding Comparison columns (see
+    COMPARISON_DTYPE). Result values are held as float64, so that missing (NULL)
+    values are returned as NaN.
+
+    The array is preallocated from a count of the comparisons, and filled
+    directly from the DBAPI cursor, rather than from an intermediate list of
+    rows.
+    """
+    statement = (
+        select([getattr(Comparison, _) for _ in COMPARISON_DTYPE.names])
+        .select_from(Comparison.__table__.join(runcomparison))
+        .where(runcomparison.c.run_id == run_id)
+    )
+    count = session.execute(
+        select([func.count()]).select_from(statement.alias())
+    ).scalar()
+    cmps = np.empty(count, dtype=COMPARISON_DTYPE)
+
+    # Comparisons could be added by another process between the two queries, so
+    # we read no more than count rows, and trim the array if there are fewer
+    result = session.execute(statement)
+    nrows = 0
+    for nrows, row in enumerate(islice(result.cursor, count), 1):
+        cmps[nrows - 1] = row
+    result.close()
+    return cmps[:nrows]
+
+
 def update_comparison_matrices(session, run) -> None:
     """Update the Run table with summary matrices for the analysis.
 
     :param session:       active pyanidb session via ORM
     :param run:           Run ORM object for the current ANIm run
     """
-    # Create dataframes for storing in the Run table
-    # Rows and columns are the (ordered) list of genome IDs
-    genome_ids = sorted([_.genome_id for _ in run.genomes.all()])
-    df_identity = pd.DataFrame(index=genome_ids, columns=genome_ids, dtype=float)
-    df_coverage = pd.DataFrame(index=genome_ids, columns=genome_ids, dtype=float)
-    df_alnlength = pd.DataFrame(index=genome_ids, columns=genome_ids, dtype=float)
-    df_simerrors = pd.DataFrame(index=genome_ids, columns=genome_ids, dtype=float)
-    df_hadamard = pd.DataFrame(index=genome_ids, columns=genome_ids, dtype=float)
+    # Create matrices for storing in the Run table, ordered by genome ID. We
+    # query only the columns we need, rather than loading complete Genome objects
+    genome_lengths = dict(
+        session.query(Genome.genome_id, Genome.length)
+        .join(rungenome)
+        .filter(rungenome.c.run_id == run.run_id)
+    )
+    genome_ids = sorted(genome_lengths)
+    size = len(genome_ids)
+    identity, coverage, alnlength, simerrors, hadamard = (
+        np.full((size, size), np.nan) for _ in range(5)
+    )
 
     # Set appropriate diagonals for each matrix
-    np.fill_diagonal(df_identity.values, 1.0)
-    np.fill_diagonal(df_coverage.values, 1.0)
-    np.fill_diagonal(df_simerrors.values, 1.0)
-    np.fill_diagonal(df_hadamard.values, 1.0)
-    for genome in run.genomes.all():
-        df_alnlength.loc[genome.genome_id, genome.genome_id] = genome.length
-
-    # Loop over all comparisons for the run and fill in result matrices
-    for cmp in run.comparisons.all():
-        qid, sid = cmp.query_id, cmp.subject_id
-        df_identity.loc[qid, sid] = cmp.identity
-        df_identity.loc[sid, qid] = cmp.identity
-        df_coverage.loc[qid, sid] = cmp.cov_query
-        df_coverage.loc[sid, qid] = cmp.cov_subject
-        df_alnlength.loc[qid, sid] = cmp.aln_length
-        df_alnlength.loc[sid, qid] = cmp.aln_length
-        df_simerrors.loc[qid, sid] = cmp.sim_errs
-        df_simerrors.loc[sid, qid] = cmp.sim_errs
-        df_hadamard.loc[qid, sid] = cmp.identity * cmp.cov_query
-        df_hadamard.loc[sid, qid] = cmp.identity * cmp.cov_subject
+    np.fill_diagonal(identity, 1.0)
+    np.fill_diagonal(coverage, 1.0)
+    np.fill_diagonal(simerrors, 1.0)
+    np.fill_diagonal(hadamard, 1.0)
+    np.fill_diagonal(alnlength, [genome_lengths[_] for _ in genome_ids])
+
+    # Fill in result matrices from all comparisons for the run. Genome IDs are
+    # converted to row/column positions in the sorted genome_ids list, so each
+    # matrix is filled with a single vectorised assignment per direction
+    cmps = get_comparisons_array(session, run.run_id)
+    if not (
+        np.isin(cmps["query_id"], genome_ids).all()
+        and np.isin(cmps["subject_id"], genome_ids).all()
+    ):
+        raise PyaniORMException(
+            f"Comparisons for run {run} include genomes not in the run"
+        )
+    qidx = np.searchsorted(genome_ids, cmps["query_id"])
+    sidx = np.searchsorted(genome_ids, cmps["subject_id"])
+    identity[qidx, sidx] = cmps["identity"]
+    identity[sidx, qidx] = cmps["identity"]
+    coverage[qidx, sidx] = cmps["cov_query"]
+    coverage[sidx, qidx] = cmps["cov_subject"]
+    alnlength[qidx, sidx] = cmps["aln_length"]
+    alnlength[sidx, qidx] = cmps["aln_length"]
+    simerrors[qidx, sidx] = cmps["sim_errs"]
+    simerrors[sidx, qidx] = cmps["sim_errs"]
+    hadamard[qidx, sidx] = cmps["identity"] * cmps["cov_query"]
+    hadamard[sidx, qidx] = cmps["identity"] * cmps["cov_subject"]
+
+    # Rows and columns of each dataframe are the (ordered) list of genome IDs
+    df_identity = pd.DataFrame(identity, index=genome_ids, columns=genome_ids)
+    df_coverage = pd.DataFrame(coverage, index=genome_ids, columns=genome_ids)
+    df_alnlength = pd.DataFrame(alnlength, index=genome_ids, columns=genome_ids)
+    df_simerrors = pd.DataFrame(simerrors, index=genome_ids, columns=genome_ids)
+    df_hadamard = pd.DataFrame(hadamard, index=genome_ids, columns=genome_ids)
 
     # Add matrices to the database
     run.df_identity = df_identity.to_json()
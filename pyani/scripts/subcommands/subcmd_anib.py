@@ -55,12 +55,15 @@ from tqdm import tqdm
 from pyani import anib
 from pyani.pyani_files import collect_existing_output
 from pyani.pyani_orm import (
+    Genome,
     PyaniORMException,
     add_run,
     add_run_genomes,
     filter_existing_comparisons,
     get_session,
+    maintain_db,
     update_comparison_matrices,
+    upgrade_db,
 )
 from pyani.pyani_tools import termcolor
 
@@ -114,6 +117,19 @@ def subcmd_anib(args: Namespace) -> None:
         )
         raise SystemExit(1)
 
+    # Databases created by earlier versions of pyani may hold comparisons with
+    # NULL fragsize or maxmatch values, which would not match the lookups made
+    # for this run
+    try:
+        backfilled = upgrade_db(session)
+    except PyaniORMException:
+        logger.error(
+            "Could not update database %s (exiting)", args.dbpath, exc_info=True
+        )
+        raise SystemExit(1)
+    if backfilled:
+        logger.info("Updated %s comparisons from an earlier pyani version", backfilled)
+
     # Add information about this run to the database
     logger.debug("Adding run info to database %s...", args.dbpath)
     try:
@@ -144,7 +160,7 @@ def subcmd_anib(args: Namespace) -> None:
 
     # Get list of genomes for this analysis from the database
     logger.info("Compiling genomes for comparison")
-    genomes = run.genomes.all()
+    genomes = run.genomes.order_by(Genome.genome_id).all()
     logger.debug("\tCollected %s genomes for this run", len(genomes))
 
     # Create output directories. We create the main parent directory (args.outdir), but
@@ -189,7 +205,7 @@ def subcmd_anib(args: Namespace) -> None:
     # but remove it from the list of comparisons to be performed
     logger.info("Checking database for existing comparison data...")
     comparisons_to_run = filter_existing_comparisons(
-        session, run, comparisons, "blastn", blastn_version, args.fragsize, None
+        session, run, comparisons, "blastn", blastn_version, args.fragsize, False
     )
     logger.info(
         f"\t...after check, still need to run {len(comparisons_to_run)} comparisons"
@@ -206,6 +222,7 @@ def subcmd_anib(args: Namespace) -> None:
         )
         logger.info("Updating summary matrices with existing results")
         update_comparison_matrices(session, run)
+        maintain_db(args.dbpath)
         return
 
     # If we are in recovery mode, we are salvaging output from a previous
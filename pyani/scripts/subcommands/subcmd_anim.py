@@ -59,13 +59,16 @@ from pyani import (
 )
 from pyani.pyani_files import collect_existing_output
 from pyani.pyani_orm import (
-    Comparison,
+    Genome,
     PyaniORMException,
+    add_comparisons,
     add_run,
     add_run_genomes,
     filter_existing_comparisons,
     get_session,
+    maintain_db,
     update_comparison_matrices,
+    upgrade_db,
 )
 from pyani.pyani_tools import termcolor
 
@@ -126,7 +129,7 @@ class ProgParams(NamedTuple):
     as SQLite/Python nulls do not match up well
     """
 
-    fragsize: str
+    fragsize: int
     maxmatch: bool
 
 
@@ -183,6 +186,19 @@ def subcmd_anim(args: Namespace) -> None:
         )
         raise SystemExit(1)
 
+    # Databases created by earlier versions of pyani may hold comparisons with
+    # NULL fragsize or maxmatch values, which would not match the lookups made
+    # for this run
+    try:
+        backfilled = upgrade_db(session)
+    except PyaniORMException:
+        logger.error(
+            "Could not update database %s (exiting)", args.dbpath, exc_info=True
+        )
+        raise SystemExit(1)
+    if backfilled:
+        logger.info("Updated %s comparisons from an earlier pyani version", backfilled)
+
     # Add information about this run to the database
     logger.debug("Adding run info to database %s...", args.dbpath)
     try:
@@ -229,7 +245,7 @@ def subcmd_anim(args: Namespace) -> None:
 
     # Get list of genome IDs for this analysis from the database
     logger.info("Compiling genomes for comparison")
-    genomes = run.genomes.all()
+    genomes = run.genomes.order_by(Genome.genome_id).all()
     logger.debug("Collected %s genomes for this run", len(genomes))
 
     # Generate all pair combinations of genome IDs as a list of (Genome, Genome) tuples
@@ -244,7 +260,7 @@ def subcmd_anim(args: Namespace) -> None:
     # but remove it from the list of comparisons to be performed
     logger.info("Checking database for existing comparison data...")
     comparisons_to_run = filter_existing_comparisons(
-        session, run, comparisons, "nucmer", nucmer_version, None, args.maxmatch
+        session, run, comparisons, "nucmer", nucmer_version, 0, args.maxmatch
     )
     logger.info(
         "\t...after check, still need to run %s comparisons", len(comparisons_to_run)
@@ -261,6 +277,7 @@ def subcmd_anim(args: Namespace) -> None:
         )
         logger.info("Updating summary matrices with existing results")
         update_comparison_matrices(session, run)
+        maintain_db(args.dbpath)
         return
 
     # If we are in recovery mode, we are salvaging output from a previous
@@ -298,6 +315,7 @@ def subcmd_anim(args: Namespace) -> None:
     logger.info("Adding comparison results to database...")
     update_comparison_results(joblist, run, session, nucmer_version, args)
     update_comparison_matrices(session, run)
+    maintain_db(args.dbpath)
     logger.info("...database updated.")
 
 
@@ -400,7 +418,8 @@ def update_comparison_results(
     """
     logger = logging.getLogger(__name__)
 
-    # Add individual results to Comparison table
+    # Collect individual results for the Comparison table
+    comparisons = []
     for job in tqdm(joblist, disable=args.disable_tqdm):
         logger.debug("\t%s vs %s", job.query.description, job.subject.description)
         aln_length, sim_errs = anim.parse_delta(job.outfile)
@@ -410,22 +429,22 @@ def update_comparison_results(
             pid = 1 - sim_errs / aln_length
         except ZeroDivisionError:  # aln_length was zero (no alignment)
             pid = 0
-        run.comparisons.append(
-            Comparison(
-                query=job.query,
-                subject=job.subject,
-                aln_length=aln_length,
-                sim_errs=sim_errs,
-                identity=pid,
-                cov_query=qcov,
-                cov_subject=scov,
-                program="nucmer",
-                version=nucmer_version,
-                fragsize=None,
-                maxmatch=args.maxmatch,
-            )
+        comparisons.append(
+            {
+                "query_id": job.query.genome_id,
+                "subject_id": job.subject.genome_id,
+                "aln_length": aln_length,
+                "sim_errs": sim_errs,
+                "identity": pid,
+                "cov_query": qcov,
+                "cov_subject": scov,
+                "program": "nucmer",
+                "version": nucmer_version,
+                "fragsize": 0,
+                "maxmatch": args.maxmatch,
+            }
         )
 
-    # Populate db
+    # Populate db in a single batch
     logger.debug("Committing results to database")
-    session.commit()
+    add_comparisons(session, run, comparisons)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# (c) University of Strathclyde 2019-2020
+# Author: Leighton Pritchard
+#
+# Contact:
+# leighton.pritchard@strath.ac.uk
+#
+# Leighton Pritchard,
+# Strathclyde Institute for Pharmacy and Biomedical Sciences,
+# 161 Cathedral Street,
+# Glasgow,
+# G4 0RE
+# Scotland,
+# UK
+#
+# The MIT License
+#
+# Copyright (c) 2019-2020 University of Strathclyde
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""Test download.py module.
+
+These tests are intended to be run from the repository root using:
+
+pytest -v
+"""
+
+import hashlib
+import unittest
+
+from pathlib import Path
+from unittest import mock
+
+from pyani import download
+
+
+class TestCreateHash(unittest.TestCase):
+
+    """Class defining tests of genome file hashing."""
+
+    def setUp(self):
+        """Set path to test genome and its expected MD5 hash."""
+        self.fpath = Path("tests/test_ani_data/NC_002696.fna")
+        with open(self.fpath, "rb") as ifh:
+            self.md5 = hashlib.md5(ifh.read()).hexdigest()
+
+    @unittest.skipUnless(
+        hasattr(hashlib, "file_digest"), "requires hashlib.file_digest()"
+    )
+    def test_create_hash_file_digest(self):
+        """create_hash() with hashlib.file_digest() returns the MD5 hexdigest."""
+        self.assertEqual(download.create_hash(self.fpath), self.md5)
+
+    def test_create_hash_chunked(self):
+        """create_hash() without hashlib.file_digest() returns the MD5 hexdigest."""
+        with mock.patch.object(download, "hashlib", mock.Mock(spec=["md5"])) as mod:
+            mod.md5 = hashlib.md5
+            self.assertEqual(download.create_hash(self.fpath), self.md5)
@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# (c) University of Strathclyde 2019-2020
+# Author: Leighton Pritchard
+#
+# Contact:
+# leighton.pritchard@strath.ac.uk
+#
+# Leighton Pritchard,
+# Strathclyde Institute for Pharmacy and Biomedical Sciences,
+# 161 Cathedral Street,
+# Glasgow,
+# G4 0RE
+# Scotland,
+# UK
+#
+# The MIT License
+#
+# Copyright (c) 2019-2020 University of Strathclyde
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""Test pyani_orm.py module.
+
+These tests are intended to be run from the repository root using:
+
+pytest -v
+"""
+
+import datetime
+import shutil
+import sqlite3
+import unittest
+
+from io import StringIO
+from itertools import combinations
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from pyani import pyani_orm
+
+
+class TestORMSessions(unittest.TestCase):
+
+    """Class defining tests of pyani database engines and sessions."""
+
+    def setUp(self):
+        """Create an empty pyani database for each test."""
+        self.dbpath = Path("tests/test_output/orm/pyanidb")
+        self.dbpath.parent.mkdir(parents=True, exist_ok=True)
+        if self.dbpath.is_file():
+            self.dbpath.unlink()
+        pyani_orm.create_db(self.dbpath)
+
+    def tearDown(self):
+        """Close pooled database connections."""
+        pyani_orm.dispose_engines()
+
+    def add_run(self, session, name):
+        """Add a Run with the passed name to the passed session."""
+        session.add(
+            pyani_orm.Run(
+                method="ANIm",
+                cmdline="pyani anim",
+                date=datetime.datetime.now(),
+                status="started",
+                name=name,
+            )
+        )
+
+    def test_engine_cached(self):
+        """Engines are reused for a database path, and replaced by create_db()."""
+        engine = pyani_orm.get_engine(self.dbpath)
+        self.assertIs(engine, pyani_orm.get_engine(self.dbpath))
+        pyani_orm.create_db(self.dbpath)
+        self.assertIsNot(engine, pyani_orm.get_engine(self.dbpath))
+
+    def test_session_isolation(self):
+        """Sessions on the same database have independent transactions."""
+        session_a = pyani_orm.get_session(self.dbpath)
+        session_b = pyani_orm.get_session(self.dbpath)
+        self.add_run(session_a, "rolled back")
+        session_a.flush()
+        session_b.query(pyani_orm.Run).all()
+        session_b.commit()
+        session_a.rollback()
+        self.add_run(session_b, "committed")
+        session_b.commit()
+        names = [
+            _.name for _ in pyani_orm.get_session(self.dbpath).query(pyani_orm.Run)
+        ]
+        self.assertEqual(names, ["committed"])
+
+    def test_journal_mode(self):
+        """New databases use WAL journalling; existing databases are unchanged."""
+        with pyani_orm.get_engine(self.dbpath).connect() as conn:
+            self.assertEqual(conn.execute("PRAGMA journal_mode").scalar(), "wal")
+        olddbpath = self.dbpath.with_name("olddb")
+        if olddbpath.is_file():
+            olddbpath.unlink()
+        pyani_orm.Base.metadata.create_all(
+            pyani_orm.create_engine("sqlite:///{}".format(olddbpath))
+        )
+        with pyani_orm.get_engine(olddbpath).connect() as conn:
+            self.assertEqual(conn.execute("PRAGMA journal_mode").scalar(), "delete")
+
+    def test_maintain_db(self):
+        """maintain_db() gathers planner statistics and empties the WAL."""
+        session = pyani_orm.get_session(self.dbpath)
+        self.add_run(session, "committed")
+        session.commit()
+        session.close()
+        pyani_orm.maintain_db(self.dbpath)
+        with pyani_orm.get_engine(self.dbpath).connect() as conn:
+            tables = [_[0] for _ in conn.execute("SELECT name FROM sqlite_master")]
+        self.assertIn("sqlite_stat1", tables)
+        self.assertEqual(Path(str(self.dbpath) + "-wal").stat().st_size, 0)
+
+    def test_optimize_on_close(self):
+        """PRAGMA optimize is run only on connections that changed the database."""
+        for total_changes, statements in ((0, []), (2, ["PRAGMA optimize"])):
+            dbapi_conn = mock.Mock(total_changes=total_changes)
+            pyani_orm.optimize_sqlite_connection(dbapi_conn, None)
+            self.assertEqual(
+                [_[0][0] for _ in dbapi_conn.execute.call_args_list], statements
+            )
+
+    def test_optimize_on_close_error(self):
+        """Errors from PRAGMA optimize do not escape the close event."""
+        dbapi_conn = mock.Mock(total_changes=1)
+        dbapi_conn.execute.side_effect = sqlite3.OperationalError("database is locked")
+        pyani_orm.optimize_sqlite_connection(dbapi_conn, None)
+
+
+class TestORMComparisons(unittest.TestCase):
+
+    """Class defining tests of adding and recovering pairwise comparisons."""
+
+    def setUp(self):
+        """Create a pyani database with three genomes in one run."""
+        self.dbpath = Path("tests/test_output/orm/comparisondb")
+        self.dbpath.parent.mkdir(parents=True, exist_ok=True)
+        if self.dbpath.is_file():
+            self.dbpath.unlink()
+        pyani_orm.create_db(self.dbpath)
+        self.session = pyani_orm.get_session(self.dbpath)
+        self.genomes = [
+            pyani_orm.Genome(
+                genome_hash="hash{}".format(idx),
+                path="genome{}.fna".format(idx),
+                length=1000 * idx,
+                description="genome {}".format(idx),
+            )
+            for idx in range(1, 4)
+        ]
+        self.session.add_all(self.genomes)
+        self.session.commit()
+        self.run = self.new_run("run 1")
+
+    def tearDown(self):
+        """Close the session and pooled database connections."""
+        self.session.close()
+        pyani_orm.dispose_engines()
+
+    def new_run(self, name):
+        """Return a new Run, associated with all test genomes."""
+        run = pyani_orm.add_run(
+            self.session, "ANIm", "pyani anim", datetime.datetime.now(), "started", name
+        )
+        self.session.execute(
+            pyani_orm.rungenome.insert(),
+            [{"genome_id": _.genome_id, "run_id": run.run_id} for _ in self.genomes],
+        )
+        self.session.commit()
+        return run
+
+    def comparison_rows(self, identity=0.99):
+        """Return comparison dicts for all pairs of test genomes."""
+        return [
+            {
+                "query_id": query.genome_id,
+                "subject_id": subject.genome_id,
+                "aln_length": 900,
+                "sim_errs": 9,
+                "identity": identity,
+                "cov_query": 0.9,
+                "cov_subject": 0.8,
+                "program": "nucmer",
+                "version": "test",
+                "fragsize": 0,
+                "maxmatch": False,
+            }
+            for query, subject in combinations(self.genomes, 2)
+        ]
+
+    def test_add_comparisons(self):
+        """add_comparisons() returns the IDs of the new run comparisons."""
+        comparison_ids = pyani_orm.add_comparisons(
+            self.session, self.run, self.comparison_rows()
+        )
+        self.assertEqual(len(comparison_ids), 3)
+        self.assertEqual(
+            sorted(comparison_ids),
+            sorted(_.comparison_id for _ in self.run.comparisons),
+        )
+
+    def test_reuse_comparisons(self):
+        """Comparisons from a previous run are reused by a new run."""
+        pyani_orm.add_comparisons(self.session, self.run, self.comparison_rows())
+        run = self.new_run("run 2")
+        comparisons_to_run = pyani_orm.filter_existing_comparisons(
+            self.session,
+            run,
+            list(combinations(self.genomes, 2)),
+            "nucmer",
+            "test",
+            0,
+            False,
+        )
+        self.assertEqual(comparisons_to_run, [])
+        self.assertEqual(run.comparisons.count(), 3)
+
+    def test_new_comparisons(self):
+        """Comparisons with other settings are not reused by a new run."""
+        pyani_orm.add_comparisons(self.session, self.run, self.comparison_rows())
+        run = self.new_run("run 2")
+        comparisons_to_run = pyani_orm.filter_existing_comparisons(
+            self.session,
+            run,
+            list(combinations(self.genomes, 2)),
+            "nucmer",
+            "test",
+            0,
+            True,
+        )
+        self.assertEqual(len(comparisons_to_run), 3)
+        self.assertEqual(run.comparisons.count(), 0)
+
+    def test_comparisons_array(self):
+        """get_comparisons_array() returns NULL results as NaN."""
+        pyani_orm.add_comparisons(
+            self.session, self.run, self.comparison_rows(identity=None)
+        )
+        cmps = pyani_orm.get_comparisons_array(self.session, self.run.run_id)
+        self.assertEqual(len(cmps), 3)
+        self.assertTrue(np.isnan(cmps["identity"]).all())
+        np.testing.assert_array_equal(cmps["aln_length"], [900, 900, 900])
+
+    def test_update_comparison_matrices(self):
+        """Summary matrices are filled from the run's comparisons."""
+        pyani_orm.add_comparisons(self.session, self.run, self.comparison_rows())
+        pyani_orm.update_comparison_matrices(self.session, self.run)
+        ids = [_.genome_id for _ in self.genomes]
+        df_identity = pd.read_json(StringIO(self.run.df_identity))
+        df_alnlength = pd.read_json(StringIO(self.run.df_alnlength))
+        df_coverage = pd.read_json(StringIO(self.run.df_coverage))
+        self.assertEqual(df_identity.loc[ids[0], ids[1]], 0.99)
+        self.assertEqual(df_identity.loc[ids[1], ids[0]], 0.99)
+        self.assertEqual(df_identity.loc[ids[2], ids[2]], 1.0)
+        self.assertEqual(df_alnlength.loc[ids[2], ids[2]], 3000)
+        self.assertEqual(df_coverage.loc[ids[0], ids[2]], 0.9)
+        self.assertEqual(df_coverage.loc[ids[2], ids[0]], 0.8)
+
+    def test_update_comparison_matrices_foreign_genome(self):
+        """Comparisons with genomes outside the run are rejected."""
+        genome = pyani_orm.Genome(genome_hash="hash4", path="genome4.fna", length=1)
+        self.session.add(genome)
+        self.session.commit()
+        rows = self.comparison_rows()
+        rows[0]["subject_id"] = genome.genome_id
+        pyani_orm.add_comparisons(self.session, self.run, rows)
+        with self.assertRaises(pyani_orm.PyaniORMException):
+            pyani_orm.update_comparison_matrices(self.session, self.run)
+
+    def test_backfill_comparisons(self):
+        """NULL fragsize/maxmatch values from earlier versions are replaced."""
+        # Recreate the comparisons table as written by earlier pyani versions,
+        # which allowed NULL fragsize and maxmatch values
+        self.session.execute("PRAGMA user_version=0")
+        self.session.execute("DROP TABLE comparisons")
+        self.session.execute(
+            """CREATE TABLE comparisons (
+                comparison_id INTEGER PRIMARY KEY,
+                query_id INTEGER NOT NULL, subject_id INTEGER NOT NULL,
+                aln_length INTEGER, sim_errs INTEGER, identity FLOAT,
+                cov_query FLOAT, cov_subject FLOAT, program VARCHAR,
+                version VARCHAR, fragsize INTEGER, maxmatch BOOLEAN,
+                UNIQUE (query_id, subject_id, program, version, fragsize, maxmatch)
+            )"""
+        )
+        rows = self.comparison_rows()
+        for row in rows:
+            row["fragsize"] = None
+        pyani_orm.add_comparisons(self.session, self.run, rows)
+
+        self.assertEqual(pyani_orm.upgrade_db(self.session), 3)
+        self.assertEqual(
+            self.session.execute("PRAGMA user_version").scalar(),
+            pyani_orm.SCHEMA_VERSION,
+        )
+        self.assertEqual(pyani_orm.upgrade_db(self.session), 0)
+        indexes = [
+            _[0]
+            for _ in self.session.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index'"
+            )
+        ]
+        self.assertIn("ix_runs_genomes_run_id", indexes)
+        self.assertIn("ix_runs_comparisons_run_id", indexes)
+        run = self.new_run("run 2")
+        comparisons_to_run = pyani_orm.filter_existing_comparisons(
+            self.session,
+            run,
+            list(combinations(self.genomes, 2)),
+            "nucmer",
+            "test",
+            0,
+            False,
+        )
+        self.assertEqual(comparisons_to_run, [])
+
+    def test_upgrade_db_no_tables(self):
+        """upgrade_db() raises PyaniORMException for a database without tables."""
+        dbpath = self.dbpath.with_name("emptydb")
+        if dbpath.is_file():
+            dbpath.unlink()
+        session = pyani_orm.get_session(dbpath)
+        with self.assertRaises(pyani_orm.PyaniORMException):
+            pyani_orm.upgrade_db(session)
+        session.close()
+
+
+class TestORMGenomes(unittest.TestCase):
+
+    """Class defining tests of adding genomes to a pyani database."""
+
+    def setUp(self):
+        """Create an empty pyani database for each test."""
+        self.dbpath = Path("tests/test_output/orm/genomedb")
+        self.dbpath.parent.mkdir(parents=True, exist_ok=True)
+        if self.dbpath.is_file():
+            self.dbpath.unlink()
+        pyani_orm.create_db(self.dbpath)
+        self.session = pyani_orm.get_session(self.dbpath)
+
+    def tearDown(self):
+        """Close the session and pooled database connections."""
+        self.session.close()
+        pyani_orm.dispose_engines()
+
+    def new_run(self, name):
+        """Return a new Run."""
+        return pyani_orm.add_run(
+            self.session, "ANIm", "pyani anim", datetime.datetime.now(), "started", name
+        )
+
+    def test_add_run_genomes_twice(self):
+        """Adding the same genomes to a run twice reuses genomes and links."""
+        indir = Path("tests/test_input/subcmd_anim")
+        run = self.new_run("run 1")
+        genome_ids = pyani_orm.add_run_genomes(self.session, run, indir, None, None)
+        self.assertEqual(
+            pyani_orm.add_run_genomes(self.session, run, indir, None, None), genome_ids,
+        )
+        self.assertEqual(len(set(genome_ids)), 6)
+        self.assertEqual(self.session.query(pyani_orm.Genome).count(), 6)
+        self.assertEqual(
+            self.session.execute("SELECT COUNT(*) FROM runs_genomes").scalar(), 6
+        )
+
+    def test_duplicate_genome_files(self):
+        """Input files with the same hash are associated with a run once."""
+        # Recreate the linker table as written by earlier pyani versions,
+        # without a unique constraint
+        self.session.execute("DROP TABLE runs_genomes")
+        self.session.execute(
+            "CREATE TABLE runs_genomes (genome_id INTEGER, run_id INTEGER)"
+        )
+        indir = self.dbpath.with_name("duplicate_genomes")
+        indir.mkdir(exist_ok=True)
+        srcstem = "tests/test_input/subcmd_anim/GCF_000011745.1_ASM1174v1_genomic"
+        for stem in ("genome_a", "genome_b"):
+            for suffix in (".fna", ".md5"):
+                shutil.copy(srcstem + suffix, str(indir / stem) + suffix)
+        run = self.new_run("run 1")
+        genome_ids = pyani_orm.add_run_genomes(self.session, run, indir, None, None)
+        self.assertEqual(len(genome_ids), 1)
+        self.assertEqual(
+            self.session.execute("SELECT COUNT(*) FROM runs_genomes").scalar(), 1
+        )
+
+    @unittest.skipUnless(
+        hasattr(sqlite3.Connection, "setlimit"), "requires Connection.setlimit()"
+    )
+    def test_existing_genomes_batched(self):
+        """Genome lookups stay within SQLite's limit on bound variables."""
+        genome_data = [
+            ("hash{}".format(idx), "genome {}".format(idx), Path("genome.fna"))
+            for idx in range(1200)
+        ]
+        self.session.execute(
+            pyani_orm.Genome.__table__.insert(),
+            [
+                {"genome_hash": inhash, "path": str(path), "description": desc}
+                for inhash, desc, path in genome_data
+            ],
+        )
+        # The limit for SQLite versions before 3.32
+        self.session.connection().connection.connection.setlimit(
+            sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999
+        )
+        genomes = pyani_orm._get_or_insert_genomes(self.session, genome_data)
+        self.assertEqual(len(genomes), 1200)